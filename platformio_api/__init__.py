@@ -14,7 +14,9 @@
 
 import json
 import logging.config
+import mmap
 import os
+from contextlib import closing
 
 
 VERSION = (1, 21, 1)
@@ -44,17 +46,20 @@ config = dict(
 )
 
 assert "PIOAPI_CONFIG_PATH" in os.environ
-with open(os.environ.get("PIOAPI_CONFIG_PATH")) as f:
-    config.update(json.load(f))
+with open(os.environ.get("PIOAPI_CONFIG_PATH"), "rb") as f:
+    with closing(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) as mm:
+        config.update(json.loads(mm[:]))
 
 # configure logging for packages
 logging.basicConfig()
 logging.config.dictConfig(config['LOGGING'])
 
-# setup time zone to UTC globally
-os.environ['TZ'] = "+00:00"
-try:
-    from time import tzset
-    tzset()
-except ImportError:
-    pass
+# setup time zone to UTC globally (skipped when inherited, e.g. TZ=+00:00
+# is exported by a service unit or a cron wrapper)
+if os.environ.get("TZ") != "+00:00":
+    os.environ['TZ'] = "+00:00"
+    try:
+        from time import tzset
+        tzset()
+    except ImportError:
+        pass
@@ -17,10 +17,7 @@ from sys import exit as sys_exit
 import click
 import requests
 
-from platformio_api import __version__, config, maintenance
-from platformio_api.database import sync_db
-from platformio_api.github_terrier import GithubTerrier
-from platformio_api.web import app
+from platformio_api import __version__, config
 
 
 @click.group()
@@ -31,44 +28,52 @@ def cli():
 
 @cli.command()
 def syncdb():
+    from platformio_api.database import sync_db
     sync_db()
     click.echo("The database has been successfully synchronized!")
 
 
 @cli.command()
 def pendinglibs():
+    from platformio_api import maintenance
     maintenance.process_pending_libs()
 
 
 @cli.command()
 def synclibs():
+    from platformio_api import maintenance
     maintenance.sync_libs()
 
 
 @cli.command()
 @click.argument('lib_id', type=int)
 def sync_lib(lib_id):
+    from platformio_api import maintenance
     maintenance.sync_lib_by_id(lib_id)
 
 
 @cli.command()
 def sync_arduino_libs():
+    from platformio_api import maintenance
     maintenance.sync_arduino_libs()
 
 
 @cli.command()
 def rotatelibsdlstats():
+    from platformio_api import maintenance
     maintenance.rotate_libs_dlstats()
 
 
 @cli.command("run")
 def runserver():
+    from platformio_api.web import app
     app.run(debug=True, reloader=True)
 
 
 @cli.command()
 @click.argument('lib_ids', type=int, nargs=-1)
 def deletelibs(lib_ids):
+    from platformio_api import maintenance
     for lib_id in lib_ids:
         maintenance.delete_library(lib_id)
 
@@ -76,6 +81,7 @@ def deletelibs(lib_ids):
 @cli.command()
 @click.argument('version_ids', type=int, nargs=-1)
 def deletelibversion(version_ids):
+    from platformio_api import maintenance
     for version_id in version_ids:
         maintenance.delete_lib_version(version_id)
 
@@ -83,16 +89,19 @@ def deletelibversion(version_ids):
 @cli.command()
 @click.option("--keep-versions", type=int)
 def cleanuplibversions(keep_versions):
+    from platformio_api import maintenance
     maintenance.cleanup_lib_versions(keep_versions)
 
 
 @cli.command()
 def optimisesyncperiod():
+    from platformio_api import maintenance
     maintenance.optimise_sync_period()
 
 
 @cli.command()
 def purge_cache():
+    from platformio_api import maintenance
     maintenance.purge_cache()
 
 
@@ -100,6 +109,7 @@ def purge_cache():
 @click.argument('search_query', type=str, nargs=1)
 @click.option('--min-repo-stars', type=int, default=5)
 def githubterrier(search_query, min_repo_stars):
+    from platformio_api.github_terrier import GithubTerrier
     gh = GithubTerrier(config['GITHUB_LOGIN'], config['GITHUB_PASSWORD'],
                        search_query, min_repo_stars)
     gh.run()
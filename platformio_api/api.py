@@ -12,14 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import logging
 import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timedelta
-from os.path import basename, join
-
-from sqlalchemy import and_, desc, distinct, func
+from operator import itemgetter
+from os.path import basename, getmtime, join
+from Queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import time
+
+from requests.exceptions import Timeout
+from sqlalchemy import (and_, bindparam, desc, exists, func, literal, null,
+                        or_, select, union_all)
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import label
-from sqlalchemy.orm.exc import NoResultFound
 
 from platformio_api import config, crawler, models, util
 from platformio_api.database import Match, db_session
@@ -27,47 +36,93 @@ from platformio_api.exception import APIBadRequest, APINotFound, InvalidLibConf
 
 logger = logging.getLogger(__name__)
 
+# compiled search queries, keyed by their structural shape
+_bakery = baked.bakery(size=500)
+
+
+def _expand_bindparams(prefix, values, params):
+    # pad IN-lists to a power of two by repeating the last value, so that
+    # a handful of compiled statements serve lists of any length
+    size = 1
+    while size < len(values):
+        size *= 2
+    values = list(values) + [values[-1]] * (size - len(values))
+    names = ["%s_%d" % (prefix, i) for i in range(size)]
+    params.update(zip(names, values))
+    return [bindparam(name) for name in names]
+
+
+def _iso_datetime(column):
+    # dates are formatted by MySQL, a string is also cheaper for the
+    # driver to decode than a datetime
+    return func.date_format(column, "%Y-%m-%dT%H:%i:%sZ")
+
 
 class APIBase(object):
 
+    __slots__ = ()
+
     def get_result(self):
         raise NotImplementedError()
 
+    @staticmethod
+    def get_cache_key():
+        # a cached result is reused only while the key stays the same
+        return None
 
-class BoardsAPI(APIBase):
 
-    @staticmethod
-    def get_result():
-        return util.load_json(
-            join(config['DL_PIO_DIR'], "api-data", "boards.json"))
+class DataFileAPIBase(APIBase):
 
+    __slots__ = ()
 
-class FrameworksAPI(APIBase):
+    DATA_FILE = None
 
-    @staticmethod
-    def get_result():
-        return util.load_json(
-            join(config['DL_PIO_DIR'], "api-data", "frameworks.json"))
+    @classmethod
+    def get_data_path(cls):
+        return join(config['DL_PIO_DIR'], "api-data", cls.DATA_FILE)
 
+    @classmethod
+    def get_result(cls):
+        return util.load_static_json(cls.get_data_path())
 
-class PackagesAPI(APIBase):
+    @classmethod
+    def get_cache_key(cls):
+        # a replaced data file invalidates the cached result at once
+        return getmtime(cls.get_data_path())
 
-    @staticmethod
-    def get_result():
-        return util.load_json(
-            join(config['DL_PIO_DIR'], "api-data", "packages.json"))
 
+class BoardsAPI(DataFileAPIBase):
 
-class PlatformsAPI(APIBase):
+    __slots__ = ()
 
-    @staticmethod
-    def get_result():
-        return util.load_json(
-            join(config['DL_PIO_DIR'], "api-data", "platforms.json"))
+    DATA_FILE = "boards.json"
+
+
+class FrameworksAPI(DataFileAPIBase):
+
+    __slots__ = ()
+
+    DATA_FILE = "frameworks.json"
+
+
+class PackagesAPI(DataFileAPIBase):
+
+    __slots__ = ()
+
+    DATA_FILE = "packages.json"
+
+
+class PlatformsAPI(DataFileAPIBase):
+
+    __slots__ = ()
+
+    DATA_FILE = "platforms.json"
 
 
 class PioStatsAPI(APIBase):
 
+    __slots__ = ()
+
     def get_result(self):
         boards = BoardsAPI.get_result()
         result = dict(
@@ -75,7 +130,7 @@ class PioStatsAPI(APIBase):
             libexamples=db_session.query(func.count(models.LibExamples.id))
             .scalar(),
             boards=len(boards),
-            mcus=len(set([b['mcu'] for b in boards])),
+            mcus=len({b['mcu'] for b in boards}),
             frameworks=len(FrameworksAPI.get_result()),
             platforms=len(PlatformsAPI.get_result()))
         return result
@@ -83,125 +138,181 @@ class PioStatsAPI(APIBase):
 
 class LibSearchAPI(APIBase):
 
-    ITEMS_PER_PAGE = 10
+    __slots__ = ("search_query", "page", "perpage", "api_version", "total",
+                 "cursor", "next_cursor")
 
-    def __init__(self, query=None, page=1, perpage=None, api_version=1):
+    ITEMS_PER_PAGE = 10
+    # the sort key of the last item on a page, used by keyset pagination
+    CURSOR_KEYS = ("lifetime", "lib_id")
+
+    PAGE_CACHE_MAXSIZE = 1024
+    PAGE_CACHE_TTL = 60
+    # (class, normalized query, page, perpage, cursor) ->
+    # (expires, rows, total, page, next cursor)
+    _page_cache = {}
+    # (class, normalized query) -> (expires, total), shared by all pages
+    _total_cache = {}
+
+    SEARCH_PARAMS = ("ids", "authors", "keywords", "frameworks", "platforms",
+                     "names", "headers")
+    # parameters matched through a many-to-many relationship of a library
+    RELATIONSHIP_PARAMS = ("authors", "keywords", "frameworks", "platforms")
+    # query prefix (`author:`, ...) to the parameter it fills
+    SEARCH_PARAM_PREFIXES = {p[:-1]: p for p in SEARCH_PARAMS}
+    # a parameter with a plain or a quoted value, an unclosed quoted value
+    # (an invalid query) or a search word
+    SEARCH_QUERY_RE = re.compile(
+        r'(?P<key>{keys}):'
+        r'(?:"(?P<quoted>.*?)"|(?P<value>[^"\s]\S*)?)(?=\s|$)'
+        r'|(?P<unclosed>(?:{keys}):"\S*)|(?P<word>\S+)'.format(
+            keys="|".join(SEARCH_PARAM_PREFIXES)))
+    # a word starting with one of them is left as the user wrote it
+    FTS_OPERATORS = frozenset("+-<>()~")
+    # boolean-mode operators without an operand and runs of asterisks
+    FTS_ESCAPE_RE = re.compile(r"(([\+\-\~\<\>]([^\w\(\"]|$))|(\*{2,}))")
+
+    def __init__(self,
+                 query=None,
+                 page=1,
+                 perpage=None,
+                 api_version=1,
+                 cursor=None):
         # if not query:
         #     raise APIBadRequest("Please specify '?query' parameter")
         self.search_query = self.parse_search_query(query)
         self.page = page
         self.perpage = perpage or self.ITEMS_PER_PAGE
         self.api_version = api_version
-
-        self.total = self.get_total()
+        self.total = None
+        self.cursor = self.decode_cursor(cursor) if cursor else None
+        self.next_cursor = None
 
         if self.perpage < 1 or self.perpage > self.ITEMS_PER_PAGE:
             self.perpage = self.ITEMS_PER_PAGE
 
-        if self.page < 1 or ((self.page - 1) * self.perpage) > self.total:
+        if self.page < 1:
             self.page = 1
 
-    def get_total(self):
-        return self._prepare_sql_query(is_count=True).scalar()
-
     def get_result(self):
-        items = []
-        query = self._prepare_sql_query().limit(self.perpage).offset(
-            (self.page - 1) * self.perpage)
-
-        for data in query.all():
-            (lib_id, lib_name, lib_description, lib_keywords, authornames,
-             dllifetime, example_nums, updated, frameworkslist,
-             platformslist) = data
-            items.append(
-                dict(
-                    id=lib_id,
-                    name=lib_name,
-                    description=lib_description,
-                    keywords=lib_keywords.split(","),
-                    authornames=authornames.split(","),
-                    frameworks=util.parse_namedtitled_list(
-                        frameworkslist, self.api_version == 1),
-                    platforms=util.parse_namedtitled_list(
-                        platformslist, self.api_version == 1),
-                    dllifetime=dllifetime,
-                    dlmonth=dllifetime,  # FIXME: Remove later
-                    examplenums=example_nums,
-                    updated=updated.strftime("%Y-%m-%dT%H:%M:%SZ")))
+        items = list(self.iter_items())
         return dict(
             total=self.total,
             page=self.page,
             perpage=self.perpage,
+            nextcursor=self.next_cursor,
             items=items)
 
-    def parse_search_query(self, query):
-        quote = "\""
+    def iter_items(self):
+        # the page is fetched here, the items are built one by one
+        return self._iter_items(self._fetch_page())
+
+    def _fetch_page(self):
+        # popular pages (the browse listing, common keywords) are served
+        # from memory for a while, however their query was spelled
+        key = self._get_query_key() + (self.page, self.perpage,
+                                       tuple(self.cursor or ()))
+        now = time()
+        entry = self._page_cache.get(key)
+        if entry and entry[0] > now:
+            _, rows, self.total, self.page, self.next_cursor = entry
+            return rows
+
+        rows = self._execute_sql_query()
+        if len(self._page_cache) >= self.PAGE_CACHE_MAXSIZE:
+            self._page_cache.clear()
+        self._page_cache[key] = (now + self.PAGE_CACHE_TTL, rows, self.total,
+                                 self.page, self.next_cursor)
+        return rows
+
+    def _get_query_key(self):
+        params = self.search_query['params']
+        return (type(self), tuple(self.search_query['words']),
+                tuple((name, tuple(sorted(params[name])))
+                      for name in sorted(params) if params[name]))
+
+    def _get_cached_total(self):
+        entry = self._total_cache.get(self._get_query_key())
+        if entry and entry[0] > time():
+            return entry[1]
+        return None
+
+    def _set_cached_total(self, total):
+        if len(self._total_cache) >= self.PAGE_CACHE_MAXSIZE:
+            self._total_cache.clear()
+        self._total_cache[self._get_query_key()] = (
+            time() + self.PAGE_CACHE_TTL, total)
+
+    def _iter_items(self, rows):
+        only_names = self.api_version == 1
+        parse_list = util.parse_namedtitled_list
+        for data in rows:
+            (lib_id, lib_name, lib_description, lib_keywords, authornames,
+             dllifetime, example_nums, updated, frameworkslist,
+             platformslist) = data
+            # a dict display is built without a keyword-arguments call
+            yield {
+                "id": lib_id,
+                "name": lib_name,
+                "description": lib_description,
+                "keywords": lib_keywords.split(","),
+                "authornames": authornames.split(","),
+                "frameworks": parse_list(frameworkslist, only_names),
+                "platforms": parse_list(platformslist, only_names),
+                "dllifetime": dllifetime,
+                "dlmonth": dllifetime,  # FIXME: Remove later
+                "examplenums": example_nums,
+                "updated": updated
+            }
+
+    # the same queries come again and again from IDEs and the web site;
+    # the parsed query is shared, so it must not be modified
+    @classmethod
+    @util.memoized(maxsize=4096)
+    def parse_search_query(cls, query):
+        params = {key: [] for key in cls.SEARCH_PARAMS}
+        prefixes = cls.SEARCH_PARAM_PREFIXES
         words = []
-        params = {
-            "ids": [],
-            "authors": [],
-            "keywords": [],
-            "frameworks": [],
-            "platforms": [],
-            "names": [],
-            "headers": []
-        }
-        state = {key: None for key in params.keys()}
 
         if query == "*":
             query = ""
 
-        for token in query.split(" "):
-            token_used = False
-            token = token.strip()
-            if not len(token):
-                continue
-
-            # if parameter's value consists from multiple words
-            for s in state.keys():
-                if state[s] is not None:
-                    state[s] += " %s" % token
-                    token_used = True
-                    break
-
-            # if new parameter
-            for s in state.keys():
-                if token.startswith("%s:" % s[:-1]):
-                    state[s] = token[len(s):]
-                    token_used = True
-                    break
-
-            if not token_used:
-                words.append(token)
-
-            # check if value is completed
-            for s in state.keys():
-                if state[s] is None:
-                    continue
-                if not state[s].startswith(quote):
-                    params[s].append(state[s])
-                    state[s] = None
-                elif state[s].startswith(quote) and state[s].endswith(quote):
-                    params[s].append(state[s][1:-1])
-                    state[s] = None
-
-        # if invalid query
-        if all([v is None for v in state.values()]):
-            return {"params": params, "words": words}
-        else:
-            return {
-                "params": {},
-                "words": [i.strip() for i in query.split(" ") if len(i)]
-            }
+        for match in cls.SEARCH_QUERY_RE.finditer(query):
+            key, quoted, value, unclosed, word = match.groups()
+            # if invalid query
+            if unclosed:
+                return {"params": {}, "words": query.split()}
+            if word:
+                words.append(word)
+            elif quoted is not None:
+                params[prefixes[key]].append(" ".join(quoted.split()))
+            else:
+                params[prefixes[key]].append(value or "")
+
+        return {"params": params, "words": words}
+
+    # the MATCH string is built once for the words of a shared query
+    @classmethod
+    @util.memoized(maxsize=4096)
+    def make_fts_query(cls, words):
+        return cls.escape_fts_query(" ".join(cls.make_fts_words_strict(words)))
+
+    @classmethod
+    def make_fts_words_strict(cls, words):
+        operators = cls.FTS_OPERATORS
+        if not any("(" in word for word in words):
+            # without groups every plain word is required
+            return [
+                word if word[0] in operators or word[-1] == "*" else
+                ('+"%s"' if "-" in word else "+%s") % word for word in words
+            ]
 
-    def make_fts_words_strict(self, words):
         items = []
         stop = False
         for word in words:
             if "(" in word:
                 stop = True
 
-            if word[0] not in "+-<>()~" and word[-1] != "*":
+            if word[0] not in operators and word[-1] != "*":
                 if "-" in word:
                     word = '"%s"' % word
                 if not stop:
@@ -213,138 +324,258 @@ class LibSearchAPI(APIBase):
             items.append(word)
         return items
 
-    def escape_fts_query(self, query):
-        return re.sub(r"(([\+\-\~\<\>]([^\w\(\"]|$))|(\*{2,}))", r'"\1"',
-                      query)
+    @classmethod
+    def escape_fts_query(cls, query):
+        return cls.FTS_ESCAPE_RE.sub(r'"\1"', query)
 
-    def _prepare_sql_query(self, is_count=False):
-        if is_count:
-            query = db_session.query(
-                func.count(distinct(models.LibFTS.lib_id)))
-        else:
-            query = db_session.query(
-                models.LibFTS.lib_id, models.LibFTS.name,
-                models.LibFTS.description, models.LibFTS.keywords,
-                models.LibFTS.authornames, models.LibDLStats.lifetime,
-                models.Libs.example_nums, models.Libs.updated,
-                models.LibFTS.frameworkslist, models.LibFTS.platformslist)
+    def decode_cursor(self, cursor):
+        try:
+            values = [
+                int(v) for v in urlsafe_b64decode(str(cursor)).split(":")
+            ]
+        except (TypeError, ValueError):
+            values = None
+        if not values or len(values) != len(self.CURSOR_KEYS):
+            raise APIBadRequest("Invalid cursor '%s'" % cursor)
+        return values
 
-        query = query.join(models.Libs, models.LibDLStats)
-        query = self._apply_filters_to_query(query, is_count)
+    @staticmethod
+    def encode_cursor(values):
+        return urlsafe_b64encode(":".join(str(v) for v in values))
+
+    def _get_cursor_values(self, row):
+        return (row[5], row[0])
+
+    def _execute_sql_query(self):
+        items = self._fetch_items()
+        # the cursor follows the page which is returned, that may be the
+        # first one when the requested page was out of range
+        if len(items) == self.perpage:
+            values = self._get_cursor_values(items[-1])
+            self.next_cursor = self.encode_cursor(values) if values else None
+        return items
 
-        if not is_count:
-            query = query.order_by(models.LibDLStats.lifetime.desc())
-        return query
+    def _fetch_items(self):
+        # paging through the same query does not count its matches again;
+        # pages past the first one always report the total, so it is known
+        # before their query and an out of range page is not fetched
+        total = self._get_cached_total()
+        if total is None and (self.cursor or self.page > 1):
+            total = self._count_total()
+        if (total is not None and not self.cursor
+                and (self.page - 1) * self.perpage > total):
+            self.page = 1
 
-    def _apply_filters_to_query(self, query, is_count=False):
+        items = self._prepare_sql_query().all()
+        if total is None:
+            # a partial first page gives the total without counting
+            if len(items) < self.perpage:
+                total = len(items)
+                self._set_cached_total(total)
+            else:
+                total = self._count_total()
+        self.total = total
+        return items
+
+    def _count_total(self):
+        total = self._prepare_count_query().scalar()
+        self._set_cached_total(total)
+        return total
+
+    def _prepare_sql_query(self):
+        bq = _bakery(lambda s: s.query(
+            models.LibFTS.lib_id, models.LibFTS.name,
+            models.LibFTS.description, models.LibFTS.keywords,
+            models.LibFTS.authornames, models.LibDLStats.lifetime,
+            models.Libs.example_nums, _iso_datetime(models.Libs.updated),
+            models.LibFTS.frameworkslist, models.LibFTS.platformslist))
+
+        bq += lambda q: q.join(models.Libs, models.LibDLStats)
+        params = {}
+        bq = self._apply_filters_to_query(bq, params)
+
+        # the secondary index on lifetime also holds lib_id (the primary
+        # key of lib_dlstats), so it serves both the order and the seek
+        bq += lambda q: q.order_by(models.LibDLStats.lifetime.desc(),
+                                   models.LibDLStats.lib_id.desc())
+        if self.cursor:
+            # the redundant upper bound turns the seek into a range scan
+            bq += lambda q: q.filter(
+                models.LibDLStats.lifetime <= bindparam("cursor_lifetime"),
+                or_(models.LibDLStats.lifetime < bindparam("cursor_lifetime"),
+                    models.LibDLStats.lib_id < bindparam("cursor_lib_id")))
+        bq = self._apply_limits_to_query(bq, params)
+        return bq(db_session).params(**params)
+
+    def _prepare_count_query(self):
+        # counted apart from the page query, SQL_CALC_FOUND_ROWS would keep
+        # it from stopping at its limit (and is deprecated by MySQL 8.0.17)
+        bq = _bakery(lambda s: s.query(func.count(
+            models.LibFTS.lib_id)).select_from(models.LibFTS).join(
+                models.Libs, models.LibDLStats))
+        params = {}
+        bq = self._apply_filters_to_query(bq, params)
+        return bq(db_session).params(**params)
+
+    def _apply_limits_to_query(self, bq, params):
+        if self.cursor:
+            # keyset pagination, a page costs the same at any depth
+            bq += lambda q: q.limit(bindparam("limit"))
+            params.update(
+                ("cursor_" + key, value)
+                for key, value in zip(self.CURSOR_KEYS, self.cursor))
+            params['limit'] = self.perpage
+            return bq
+
+        bq += lambda q: q.limit(bindparam("limit")).offset(bindparam("offset"))
+        params.update(
+            limit=self.perpage, offset=(self.page - 1) * self.perpage)
+        return bq
+
+    def _apply_filters_to_query(self, bq, params):
         # Relationship Way
         _params = self.search_query['params']
 
-        # TMP: fix renamed platforms
-        if "espressif" in _params.get("platforms", []):
-            for i, item in enumerate(_params.get("platforms")):
-                _params['platforms'][i] = "espressif8266"
-
+        # the number of bound values is a part of the cache key
         if _params.get("ids"):
-            query = query.filter(models.LibFTS.lib_id.in_(_params['ids']))
+            ids = _expand_bindparams("ids", _params['ids'], params)
+            bq.add_criteria(
+                lambda q: q.filter(models.LibFTS.lib_id.in_(ids)), len(ids))
         if _params.get("names"):
-            query = query.filter(models.LibFTS.name.in_(_params['names']))
+            names = _expand_bindparams("names", _params['names'], params)
+            bq.add_criteria(
+                lambda q: q.filter(models.LibFTS.name.in_(names)), len(names))
         if _params.get("headers"):
-            query = query.join(
-                models.LibHeaders,
-                and_(
-                    models.LibHeaders.name.in_(_params['headers']),
-                    models.LibHeaders.lib_id == models.LibFTS.lib_id))
-
-        need_grouping = False
-        for key in ("authors", "keywords", "frameworks", "platforms"):
-            if not _params.get(key):
+            headers = _expand_bindparams("headers", _params['headers'],
+                                         params)
+            bq.add_criteria(
+                lambda q: q.filter(exists().where(
+                    and_(
+                        models.LibHeaders.lib_id == models.LibFTS.lib_id,
+                        models.LibHeaders.name.in_(headers)))),
+                len(headers))
+
+        for key in self.RELATIONSHIP_PARAMS:
+            values = _params.get(key)
+            if not values:
                 continue
-            need_grouping = True
-            model_item = getattr(models, key.title())
-            model_lib_item = getattr(models, "Libs" + key.title())
-            query = query.join(model_item, model_item.name.in_(_params[key]))
-            query = query.join(
-                model_lib_item,
-                and_(model_lib_item.lib_id == models.LibFTS.lib_id,
-                     getattr(model_lib_item, key[:-1] + "_id") ==
-                     model_item.id))
-
-        if not is_count and need_grouping:
-            query = query.group_by(models.LibFTS.lib_id)
-
-        _words = self.make_fts_words_strict(self.search_query['words'])
-        if _words:
-            fts_query = self.escape_fts_query(" ".join(_words))
-            query = query.filter(
+            # TMP: fix renamed platforms
+            if key == "platforms" and "espressif" in values:
+                values = ["espressif8266"] * len(values)
+            values = _expand_bindparams(key, values, params)
+            bq.add_criteria(
+                self._make_relationship_criteria(key, values), key,
+                len(values))
+
+        if self.search_query['words']:
+            params['fts_query'] = self.make_fts_query(
+                tuple(self.search_query['words']))
+            bq += lambda q: q.filter(
                 Match([
                     models.LibFTS.name, models.LibFTS.description,
                     models.LibFTS.keywords, models.LibFTS.headerslist,
                     models.LibFTS.authornames, models.LibFTS.frameworkslist,
                     models.LibFTS.platformslist
-                ], fts_query))
-        return query
+                ], bindparam("fts_query")))
+        return bq
 
+    @staticmethod
+    def _make_relationship_criteria(key, values):
+        model_item = getattr(models, key.title())
+        model_lib_item = getattr(models, "Libs" + key.title())
+
+        def _criteria(q):
+            # a semi-join does not multiply the rows of a library which
+            # matches several values, so the result needs no grouping;
+            # the lookup by name must use its unique index whatever the
+            # optimizer thinks about the full-text part of the query
+            return q.filter(exists(
+                select([model_lib_item.lib_id]).where(
+                    and_(model_lib_item.lib_id == models.LibFTS.lib_id,
+                         getattr(model_lib_item, key[:-1] + "_id") ==
+                         model_item.id,
+                         model_item.name.in_(values))).with_hint(
+                             model_item.__table__, "USE INDEX (name)",
+                             "mysql")))
+
+        return _criteria
 
-class LibExamplesAPI(LibSearchAPI):
-
-    ITEMS_PER_PAGE = 5
-
-    def get_result(self):
-        items = []
-        query = self._prepare_sql_query().limit(self.perpage).offset(
-            (self.page - 1) * self.perpage)
-
-        for data in query.all():
-            (example, lib_name, lib_description, lib_keywords, authornames,
-             frameworkslist, platformslist) = data
-            lib_id = example.lib_id
-            items.append(
-                dict(
-                    id=example.id,
-                    name=example.name,
-                    url=util.get_libexample_url(lib_id, example.name),
-                    lib=dict(
-                        id=lib_id,
-                        name=lib_name,
-                        description=lib_description,
-                        keywords=lib_keywords.split(","),
-                        authornames=authornames.split(","),
-                        frameworks=util.parse_namedtitled_list(frameworkslist),
-                        platforms=util.parse_namedtitled_list(platformslist))))
-        return dict(
-            total=self.total,
-            page=self.page,
-            perpage=self.perpage,
-            items=items)
-
-    def _prepare_sql_query(self, is_count=False):
-        _params, _words = self.search_query
 
-        if is_count:
-            query = db_session.query(func.count(models.LibExamples.id))
-        else:
-            query = db_session.query(
-                models.LibExamples, models.LibFTS.name,
-                models.LibFTS.description, models.LibFTS.keywords,
-                models.LibFTS.authornames, models.LibFTS.frameworkslist,
-                models.LibFTS.platformslist)
+class LibExamplesAPI(LibSearchAPI):
 
-        query = query.join(models.Libs, models.LibFTS)
-        query = self._apply_filters_to_query(query, is_count)
+    __slots__ = ()
 
-        if not self.search_query['words'] and not is_count:
-            query = query.order_by(models.LibExamples.id.desc())
+    ITEMS_PER_PAGE = 5
+    CURSOR_KEYS = ("id", )
+
+    def _iter_items(self, rows):
+        parse_list = util.parse_namedtitled_list
+        for data in rows:
+            (example_id, lib_id, example_name, lib_name, lib_description,
+             lib_keywords, authornames, frameworkslist, platformslist) = data
+            yield {
+                "id": example_id,
+                "name": example_name,
+                "url": util.get_libexample_url(lib_id, example_name),
+                "lib": {
+                    "id": lib_id,
+                    "name": lib_name,
+                    "description": lib_description,
+                    "keywords": lib_keywords.split(","),
+                    "authornames": authornames.split(","),
+                    "frameworks": parse_list(frameworkslist),
+                    "platforms": parse_list(platformslist)
+                }
+            }
 
-        return query
+    def _prepare_sql_query(self):
+        bq = _bakery(lambda s: s.query(
+            models.LibExamples.id, models.LibExamples.lib_id,
+            models.LibExamples.name, models.LibFTS.name,
+            models.LibFTS.description, models.LibFTS.keywords,
+            models.LibFTS.authornames, models.LibFTS.frameworkslist,
+            models.LibFTS.platformslist))
+
+        bq += lambda q: q.join(models.Libs, models.LibFTS)
+        params = {}
+        bq = self._apply_filters_to_query(bq, params)
+
+        if not self.search_query['words'] or self.cursor:
+            bq += lambda q: q.order_by(models.LibExamples.id.desc())
+        if self.cursor:
+            bq += lambda q: q.filter(
+                models.LibExamples.id < bindparam("cursor_id"))
+        bq = self._apply_limits_to_query(bq, params)
+        return bq(db_session).params(**params)
+
+    def _prepare_count_query(self):
+        bq = _bakery(lambda s: s.query(func.count(
+            models.LibExamples.id)).select_from(models.LibExamples).join(
+                models.Libs, models.LibFTS))
+        params = {}
+        bq = self._apply_filters_to_query(bq, params)
+        return bq(db_session).params(**params)
+
+    def _get_cursor_values(self, row):
+        # matched examples are not ordered by ID unless seeking by a cursor
+        if self.search_query['words'] and not self.cursor:
+            return None
+        return (row[0], )
 
 
 class LibInfoAPI(APIBase):
 
+    __slots__ = ("id_", )
+
     def __init__(self, id_):
         self.id_ = id_
 
     def get_result(self):
+        return self._get_result(self.id_)
+
+    @staticmethod
+    @util.memoized(maxsize=4096, ttl=60)
+    def _get_result(id_):
         result = dict(
             authors=[],
             dlstats=dict(),
@@ -353,14 +584,20 @@ class LibInfoAPI(APIBase):
             frameworks={},
             platforms={})
 
-        query = db_session.query(models.Libs, models.LibVersions).join(
-            models.LibVersions,
-            models.LibVersions.id == models.Libs.latest_version_id).filter(
-                models.Libs.id == self.id_)
-        try:
-            lib, libversion = query.one()
-        except NoResultFound:
-            raise APINotFound("Unknown library with ID '%s'" % str(self.id_))
+        # the few authors and attributes of a library come with the same
+        # query instead of a lazy load of each collection
+        query = db_session.query(
+            models.Libs, models.LibVersions.name,
+            _iso_datetime(models.LibVersions.released)).join(
+                models.LibVersions,
+                models.LibVersions.id == models.Libs.latest_version_id)
+        query = query.options(
+            joinedload(models.Libs.authors),
+            joinedload(models.Libs.attributes)).filter(models.Libs.id == id_)
+        data = query.one_or_none()
+        if data is None:
+            raise APINotFound("Unknown library with ID '%s'" % str(id_))
+        lib, version_name, version_released = data
 
         result['id'] = lib.id
         result['confurl'] = lib.conf_url
@@ -374,21 +611,25 @@ class LibInfoAPI(APIBase):
 
         # examples
         if lib.example_nums:
-            for item in lib.examples:
+            query = db_session.query(models.LibExamples.name).filter(
+                models.LibExamples.lib_id == lib.id)
+            for (name, ) in query.all():
                 result['examples'].append(
-                    util.get_libexample_url(lib.id, item.name))
+                    util.get_libexample_url(lib.id, name))
 
         # latest version
         result['version'] = dict(
-            name=libversion.name,
-            released=libversion.released.strftime("%Y-%m-%dT%H:%M:%SZ"))
+            name=version_name, released=version_released)
 
         # previous versions
+        query = db_session.query(
+            models.LibVersions.name,
+            _iso_datetime(models.LibVersions.released)).filter(
+                models.LibVersions.lib_id == lib.id).order_by(
+                    models.LibVersions.released, models.LibVersions.id)
         result['versions'] = [
-            dict(
-                name=l.name,
-                released=l.released.strftime("%Y-%m-%dT%H:%M:%SZ"))
-            for l in lib.versions
+            dict(name=name, released=released)
+            for (name, released) in query.all()
         ]
 
         # authors
@@ -420,6 +661,18 @@ class LibInfoAPI(APIBase):
 
 class LibDownloadAPI(APIBase):
 
+    __slots__ = ("id_", "ip", "version", "ci")
+
+    DLLOG_QUEUE_SIZE = 10000
+    DLLOG_BATCH_SIZE = 500
+    DLLOG_FLUSH_INTERVAL = 1  # seconds
+    DLLOG_EXIT_TIMEOUT = 10  # seconds
+
+    _dllog_queue = Queue(DLLOG_QUEUE_SIZE)
+    _dllog_flusher = None
+    _dllog_flusher_lock = Lock()
+    _dllog_dropped = 0
+
     def __init__(self, id_, ip=None, version=None, ci=False):
         self.id_ = id_
         self.ip = ip
@@ -427,24 +680,23 @@ class LibDownloadAPI(APIBase):
         self.ci = ci
 
     def get_result(self):
+        bq = _bakery(lambda s: s.query(
+            models.Libs.id, models.LibVersions.id, models.LibVersions.name))
+        params = dict(lib_id=self.id_)
         if self.version:
-            query = db_session.query(
-                models.Libs.id, models.LibVersions.id,
-                models.LibVersions.name).outerjoin(
-                    models.LibVersions,
-                    and_(models.LibVersions.lib_id == models.Libs.id,
-                         models.LibVersions.name == self.version)).filter(
-                             models.Libs.id == self.id_)
+            params['version'] = self.version
+            bq += lambda q: q.outerjoin(
+                models.LibVersions,
+                and_(models.LibVersions.lib_id == models.Libs.id,
+                     models.LibVersions.name == bindparam("version")))
         else:
-            query = db_session.query(models.Libs.id, models.LibVersions.id,
-                                     models.LibVersions.name).join(
-                                         models.LibVersions,
-                                         models.LibVersions.id ==
-                                         models.Libs.latest_version_id).filter(
-                                             models.Libs.id == self.id_)
-        try:
-            data = query.one()
-        except NoResultFound:
+            bq += lambda q: q.join(
+                models.LibVersions,
+                models.LibVersions.id == models.Libs.latest_version_id)
+        bq += lambda q: q.filter(models.Libs.id == bindparam("lib_id"))
+        query = bq(db_session).params(**params)
+        data = query.one_or_none()
+        if data is None:
             raise APINotFound("Unknown library with ID '%d'" % self.id_)
 
         lib_id = data[0]
@@ -464,42 +716,142 @@ class LibDownloadAPI(APIBase):
         if not self.ip or self.ci:
             return
 
-        ip_int = util.ip2int(self.ip)
+        cls = type(self)
+        cls._start_dllog_flusher()
         try:
-            query = db_session.query(models.LibDLLog).filter(
-                models.LibDLLog.lib_id == lib_id,
-                models.LibDLLog.date > datetime.utcnow() - timedelta(hours=1),
-                models.LibDLLog.ip == ip_int)
-            item = query.one()
-            item.date = datetime.utcnow()
-        except NoResultFound:
-            db_session.query(models.LibDLStats).filter(
-                models.LibDLStats.lib_id == lib_id).update({
-                    models.LibDLStats.lifetime: models.LibDLStats.lifetime + 1,
-                    models.LibDLStats.day: models.LibDLStats.day + 1,
-                    models.LibDLStats.week: models.LibDLStats.week + 1,
-                    models.LibDLStats.month: models.LibDLStats.month + 1
-                })
-            db_session.add(models.LibDLLog(lib_id=lib_id, ip=ip_int))
+            cls._dllog_queue.put_nowait(
+                (lib_id, util.ip2int(self.ip), datetime.utcnow()))
+        except Full:
+            cls._dllog_dropped += 1
+            if cls._dllog_dropped % 1000 == 1:
+                logger.warning("Download log queue is full, dropped %d items",
+                               cls._dllog_dropped)
+
+    @classmethod
+    def _start_dllog_flusher(cls):
+        # started lazily, so that pre-forking servers get a thread per worker
+        if cls._dllog_flusher and cls._dllog_flusher.is_alive():
+            return
+        with cls._dllog_flusher_lock:
+            if cls._dllog_flusher and cls._dllog_flusher.is_alive():
+                return
+            cls._dllog_flusher = Thread(target=cls._dllog_flusher_loop)
+            cls._dllog_flusher.daemon = True
+            cls._dllog_flusher.start()
+
+    @classmethod
+    def _stop_dllog_flusher(cls):
+        # the queued downloads are written before the worker exits, the
+        # thread flushes its pending batch when it takes None off the queue
+        flusher = cls._dllog_flusher
+        if flusher and flusher.is_alive():
+            try:
+                cls._dllog_queue.put(None, timeout=cls.DLLOG_EXIT_TIMEOUT)
+                flusher.join(cls.DLLOG_EXIT_TIMEOUT)
+            except Full:
+                pass
+
+        items = []
+        while True:
+            try:
+                item = cls._dllog_queue.get_nowait()
+            except Empty:
+                break
+            if item:
+                items.append(item)
+        for i in range(0, len(items), cls.DLLOG_BATCH_SIZE):
+            with util.rollback_on_exception(db_session, logger):
+                cls._flush_dllog(items[i:i + cls.DLLOG_BATCH_SIZE])
+        db_session.close()
+
+    @classmethod
+    def _dllog_flusher_loop(cls):
+        stopped = False
+        while not stopped:
+            items = [cls._dllog_queue.get()]
+            deadline = time() + cls.DLLOG_FLUSH_INTERVAL
+            while (len(items) < cls.DLLOG_BATCH_SIZE
+                   and items[-1] is not None):
+                timeout = deadline - time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(cls._dllog_queue.get(timeout=timeout))
+                except Empty:
+                    break
+
+            stopped = None in items
+            items = [item for item in items if item]
+            if items:
+                with util.rollback_on_exception(db_session, logger):
+                    cls._flush_dllog(items)
+            db_session.close()
+
+    @staticmethod
+    def _flush_dllog(items):
+        dllog = models.LibDLLog.__table__
+        # repeated downloads from the same IP within one batch are refreshes
+        # of the same entry, so only the latest one reaches the database
+        latest = dict(((lib_id, ip_int), date)
+                      for lib_id, ip_int, date in items)
+        downloads = {}
+        new_rows = []
+        for (lib_id, ip_int), date in sorted(latest.items()):
+            # refresh a recent download from the same IP in place and count
+            # a new download only when there was nothing to refresh
+            result = db_session.execute(
+                dllog.update(mysql_limit=1).where(
+                    and_(dllog.c.lib_id == lib_id, dllog.c.ip == ip_int,
+                         dllog.c.date > date - timedelta(hours=1))).values(
+                             date=date))
+            if result.rowcount:
+                continue
+            new_rows.append(dict(lib_id=lib_id, ip=ip_int, date=date))
+            downloads[lib_id] = downloads.get(lib_id, 0) + 1
+
+        if new_rows:
+            # executemany is sent as a single multi-row INSERT
+            db_session.execute(dllog.insert(), new_rows)
+
+        if downloads:
+            dlstats = models.LibDLStats.__table__
+            nums = bindparam("nums")
+            # one statement for all libraries, rows are locked in the order
+            # of lib_id so that flushers of other workers do not deadlock
+            db_session.execute(
+                dlstats.update().where(
+                    dlstats.c.lib_id == bindparam("dl_lib_id")).values(
+                        lifetime=dlstats.c.lifetime + nums,
+                        day=dlstats.c.day + nums,
+                        week=dlstats.c.week + nums,
+                        month=dlstats.c.month + nums),
+                [dict(dl_lib_id=lib_id, nums=downloads[lib_id])
+                 for lib_id in sorted(downloads)])
 
         db_session.commit()
 
 
+atexit.register(LibDownloadAPI._stop_dllog_flusher)
+
+
 class LibVersionsAPI(APIBase):
 
+    __slots__ = ("id_", )
+
     def __init__(self, id_):
         self.id_ = id_
 
     def get_result(self):
-        result = []
-        query = db_session.query(models.LibVersions).filter(
-            models.LibVersions.lib_id == self.id_).order_by(
-                models.LibVersions.released.asc(), models.LibVersions.id.asc())
-        for version in query.all():
-            result.append(
-                dict(
-                    version=version.name,
-                    date=version.released.strftime("%Y-%m-%dT%H:%M:%SZ")))
+        query = db_session.query(
+            models.LibVersions.name,
+            _iso_datetime(models.LibVersions.released)).filter(
+                models.LibVersions.lib_id == self.id_).order_by(
+                    models.LibVersions.released.asc(),
+                    models.LibVersions.id.asc())
+        result = [
+            dict(version=name, date=released)
+            for (name, released) in query
+        ]
         if not result:
             raise APINotFound("Unknown library with ID '%s'" % self.id_)
         return result
@@ -507,25 +859,64 @@ class LibVersionsAPI(APIBase):
 
 class LibVersionAPI(APIBase):
 
+    __slots__ = ("ids", )
+
+    CACHE_MAXSIZE = 50000
+    CACHE_TTL = 60
+    # library ID -> (expires, latest version name)
+    _cache = {}
+
     def __init__(self, ids):
         self.ids = ids
         assert isinstance(ids, list)
 
     def get_result(self):
-        result = dict()
-        query = db_session.query(models.Libs.id, models.LibVersions.name).join(
-            models.LibVersions,
-            models.LibVersions.id == models.Libs.latest_version_id).filter(
-                models.Libs.id.in_(self.ids))
-        result = {i[0]: i[1] for i in query.all()}
+        result = {}
+        misses = []
+        now = time()
         for id_ in self.ids:
-            if id_ not in result:
-                result[id_] = None
+            try:
+                expires, version = self._cache[id_]
+                if expires > now:
+                    result[id_] = version
+                    continue
+            except KeyError:
+                pass
+            misses.append(id_)
+        if not misses:
+            return result
+
+        # only the expired or unknown IDs are looked up, with one query
+        versions = self._fetch_versions(misses)
+        if len(self._cache) + len(versions) > self.CACHE_MAXSIZE:
+            self._cache.clear()
+        expires = now + self.CACHE_TTL
+        for id_, version in versions.items():
+            self._cache[id_] = (expires, version)
+        result.update(versions)
+        return result
+
+    @staticmethod
+    def _fetch_versions(ids):
+        params = {}
+        binds = _expand_bindparams("ids", ids, params)
+        bq = _bakery(lambda s: s.query(
+            models.Libs.id, models.LibVersions.name).join(
+                models.LibVersions,
+                models.LibVersions.id == models.Libs.latest_version_id))
+        # one compiled statement per padded size of the IN-list
+        bq.add_criteria(
+            lambda q: q.filter(models.Libs.id.in_(binds)), len(binds))
+        # unknown IDs are reported with a null version
+        result = dict.fromkeys(ids)
+        result.update(bq(db_session).params(**params))
         return result
 
 
 class LibRegisterAPI(APIBase):
 
+    __slots__ = ("conf_url", )
+
     def __init__(self, conf_url):
         self.conf_url = conf_url.strip() if conf_url else None
         if not self.conf_url:
@@ -535,6 +926,12 @@ class LibRegisterAPI(APIBase):
         result = dict(successed=False, message=None)
 
         try:
+            # check for pending duplicates before fetching the manifest
+            query = db_session.query(models.PendingLibs.id).filter(
+                models.PendingLibs.conf_url == self.conf_url).exists()
+            if db_session.query(query).scalar():
+                raise InvalidLibConf("The library is already registered")
+
             manifest_name = basename(self.conf_url)
             if manifest_name.endswith(".properties"):
                 cls = crawler.ArduinoLibSyncer
@@ -546,12 +943,6 @@ class LibRegisterAPI(APIBase):
             config = cls.load_config(self.conf_url)
             assert cls.validate_config(config)
 
-            # check for pending duplicates
-            query = db_session.query(func.count(1)).filter(
-                models.PendingLibs.conf_url == self.conf_url)
-            if query.scalar():
-                raise InvalidLibConf("The library is already registered")
-
             db_session.add(models.PendingLibs(conf_url=self.conf_url))
             db_session.commit()
             result['successed'] = True
@@ -559,6 +950,9 @@ class LibRegisterAPI(APIBase):
                                  "registered and is waiting for moderation")
         except InvalidLibConf as e:
             result['message'] = str(e)
+        except Timeout:
+            result['message'] = ("The library manifest could not be fetched "
+                                 "in time. Please try again later")
         except Exception as e:
             logger.exception(e)
             result['message'] = (
@@ -569,76 +963,108 @@ class LibRegisterAPI(APIBase):
 
 class LibStatsAPI(APIBase):
 
-    def get_result(self):
-        result = dict(
-            updated=self._get_last_updated(),
-            added=self._get_last_added(),
-            lastkeywords=self._get_last_keywords(),
-            topkeywords=self._get_top_keywords(),
-            dlday=self._get_most_downloaded(models.LibDLStats.day),
-            dlweek=self._get_most_downloaded(models.LibDLStats.week),
-            dlmonth=self._get_most_downloaded(models.LibDLStats.month))
+    __slots__ = ()
+
+    DL_PERIODS = ("day", "week", "month")
+
+    # /lib/stats keeps the serialized result for 60 seconds, the dict is
+    # not cached here as well
+    @staticmethod
+    def get_result():
+        selects = [
+            LibStatsAPI._select_last_libs("updated", models.Libs.updated),
+            LibStatsAPI._select_last_libs("added", models.Libs.added),
+            LibStatsAPI._select_last_keywords("lastkeywords"),
+            LibStatsAPI._select_top_keywords("topkeywords")
+        ]
+        for period in LibStatsAPI.DL_PERIODS:
+            selects.append(
+                LibStatsAPI._select_most_downloaded("dl%s" % period, period))
+
+        # all sections come with one statement, each row is tagged with the
+        # name of its section
+        rows = {}
+        for row in db_session.execute(union_all(*selects)):
+            rows.setdefault(row[0], []).append(row)
+        # the order of UNION ALL rows is not guaranteed; the formatted
+        # dates sort correctly as text
+        for section, items in rows.items():
+            items.sort(
+                key=itemgetter(3 if section in ("updated", "added") else 6),
+                reverse=True)
+
+        result = dict()
+        for section in ("updated", "added"):
+            result[section] = [
+                dict(id=id_, name=name, date=date)
+                for (_, id_, name, date, _, _, _) in rows.get(section, [])
+            ]
+        for section in ("lastkeywords", "topkeywords"):
+            result[section] = [row[2] for row in rows.get(section, [])]
+        for period in LibStatsAPI.DL_PERIODS:
+            section = "dl%s" % period
+            result[section] = [
+                dict(id=id_, name=name, total=total, diff=diff)
+                for (_, id_, name, _, total, diff, _) in rows.get(section, [])
+            ]
         return result
 
-    def _get_last_updated(self, limit=5):
-        items = []
-        query = db_session.query(
-            models.Libs.id, models.Libs.updated,
-            models.LibFTS.name).join(models.LibFTS).order_by(
-                models.Libs.updated.desc()).limit(limit)
-        for item in query.all():
-            items.append(
-                dict(
-                    id=item[0],
-                    name=item[2],
-                    date=item[1].strftime("%Y-%m-%dT%H:%M:%SZ")))
-        return items
+    # every section selects (section, id, name, date, total, diff,
+    # sort_key) with an integer or NULL sort key, so that MySQL does not
+    # turn the column into text, and is wrapped into a derived table as
+    # MySQL does not accept LIMIT on a bare UNION member
 
-    def _get_last_added(self, limit=5):
-        items = []
-        query = db_session.query(
-            models.Libs.id, models.Libs.added, models.LibFTS.name).join(
-                models.LibFTS).order_by(models.Libs.added.desc()).limit(limit)
-        for item in query.all():
-            items.append(
-                dict(
-                    id=item[0],
-                    name=item[2],
-                    date=item[1].strftime("%Y-%m-%dT%H:%M:%SZ")))
-        return items
+    @staticmethod
+    def _select_last_libs(section, column, limit=5):
+        return select([
+            literal(section).label("section"), models.Libs.id,
+            models.LibFTS.name,
+            _iso_datetime(column).label("date"),
+            null().label("total"),
+            null().label("diff"),
+            null().label("sort_key")
+        ]).select_from(models.Libs.__table__.join(
+            models.LibFTS.__table__)).order_by(
+                column.desc()).limit(limit).alias().select()
 
-    def _get_last_keywords(self, limit=5):
-        items = []
-        query = db_session.query(models.Keywords.name).order_by(
-            models.Keywords.id.desc()).limit(limit)
-        for item in query.all():
-            items.append(item[0])
-        return items
+    @staticmethod
+    def _select_last_keywords(section, limit=5):
+        return select([
+            literal(section).label("section"), models.Keywords.id,
+            models.Keywords.name,
+            null().label("date"),
+            null().label("total"),
+            null().label("diff"),
+            models.Keywords.id.label("sort_key")
+        ]).order_by(models.Keywords.id.desc()).limit(limit).alias().select()
 
-    def _get_top_keywords(self, limit=50):
-        items = []
-        query = db_session.query(
-            models.Keywords.name, func.count(models.Keywords.id).label(
-                "total")).join(models.LibsKeywords).group_by(
-                    models.Keywords.id).order_by(desc("total")).limit(limit)
-        for item in query.all():
-            items.append(item[0])
-        return items
+    @staticmethod
+    def _select_top_keywords(section, limit=50):
+        return select([
+            literal(section).label("section"), models.Keywords.id,
+            models.Keywords.name,
+            null().label("date"),
+            null().label("total"),
+            null().label("diff"),
+            func.count(models.Keywords.id).label("sort_key")
+        ]).select_from(models.Keywords.__table__.join(
+            models.LibsKeywords.__table__)).group_by(
+                models.Keywords.id).order_by(
+                    desc("sort_key")).limit(limit).alias().select()
 
-    def _get_most_downloaded(self, period, limit=10):
-        period_prev = getattr(models.LibDLStats, "%s_prev" % period.key)
-        items = []
-        query = db_session.query(
-                period,
-                label("diff", period - period_prev),
-                models.LibFTS.lib_id, models.LibFTS.name)\
-            .join(models.LibFTS,
-                  models.LibDLStats.lib_id == models.LibFTS.lib_id)\
-            .filter(period >= period_prev)\
-            .order_by(desc("diff"))\
-            .limit(limit)
-        for item in query.all():
-            items.append(
-                dict(
-                    id=item[2], name=item[3], total=item[0], diff=item[1]))
-        return items
+    @staticmethod
+    def _select_most_downloaded(section, period, limit=10):
+        total = getattr(models.LibDLStats, period)
+        total_prev = getattr(models.LibDLStats, "%s_prev" % period)
+        return select([
+            literal(section).label("section"), models.LibFTS.lib_id,
+            models.LibFTS.name,
+            null().label("date"),
+            total.label("total"),
+            label("diff", total - total_prev),
+            label("sort_key", total - total_prev)
+        ]).select_from(models.LibDLStats.__table__.join(
+            models.LibFTS.__table__,
+            models.LibDLStats.lib_id == models.LibFTS.lib_id)).where(
+                total >= total_prev).order_by(
+                    desc("diff")).limit(limit).alias().select()
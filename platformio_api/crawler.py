@@ -26,7 +26,6 @@ from shutil import copy, copytree, rmtree
 from tempfile import mkdtemp, mkstemp
 from urlparse import urlparse
 
-import requests
 from sqlalchemy import and_
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -65,7 +64,7 @@ class LibSyncerBase(object):
             self.config = self.load_config(lib.conf_url)
             self.config = self.validate_config(self.config)
             self.config = self.clean_dict(self.config)
-            logger.debug("LibConf: %s" % self.config)
+            logger.debug("LibConf: %s", self.config)
         except Exception as e:
             logger.error(e)
             raise InvalidLibConf(lib.conf_url)
@@ -129,7 +128,7 @@ class LibSyncerBase(object):
 
         if not authors:
             raise InvalidLibConf("The 'authors' field is required")
-        elif not all(["name" in item for item in authors]):
+        elif not all("name" in item for item in authors):
             raise InvalidLibConf("An each author should have 'name' property")
         elif ("repository" in config
               and config['repository'].get("type", None) in ("git", "svn")):
@@ -300,7 +299,7 @@ class LibSyncerBase(object):
         return keywords
 
     def _cleanup_keywords(self, keywords):
-        assert any([isinstance(keywords, t) for t in (list, basestring)])
+        assert isinstance(keywords, (list, basestring))
         if not isinstance(keywords, list):
             keywords = [k for k in keywords.split(",")]
         keywords = list(set([k.lower().strip() for k in keywords]))
@@ -326,7 +325,7 @@ class LibSyncerBase(object):
             return list(set([i.lower().strip() for i in items_]))
 
         assert what in ("frameworks", "platforms")
-        assert any([isinstance(items, t) for t in (list, basestring)])
+        assert isinstance(items, (list, basestring))
         items = _process_items(items)
 
         dbitems = []
@@ -555,8 +554,8 @@ class LibSyncerBase(object):
             repo_dir = mkdtemp(dir=tmp_dir)
             try:
                 client.clone(repo_dir)
-            except:
-                logger.warn("Invalid mbed example %s" % url)
+            except Exception:
+                logger.warn("Invalid mbed example %s", url)
                 continue
             for old_file_path in util.get_c_sources(repo_dir):
                 if isdir(old_file_path):
@@ -577,8 +576,9 @@ class PlatformIOLibSyncer(LibSyncerBase):
 
     @staticmethod
     def load_config(manifest_url):
-        config_text = requests.get(manifest_url).text.encode("utf-8")
-        manifest = json.loads(config_text)
+        # JSON is decoded from the raw UTF-8 body, without a round trip
+        # through the text guessed from the response headers
+        manifest = json.loads(util.http_session.get(manifest_url).content)
         if "url" in manifest:
             manifest['homepage'] = manifest['url']
             del manifest['url']
@@ -612,7 +612,7 @@ class ArduinoLibSyncer(LibSyncerBase):
     @staticmethod
     def load_config(manifest_url):
         manifest = {}
-        config_text = requests.get(manifest_url).text.encode("utf-8")
+        config_text = util.http_session.get(manifest_url).text.encode("utf-8")
         for line in config_text.split("\n"):
             if "=" not in line:
                 continue
@@ -737,8 +737,9 @@ class YottaLibSyncer(LibSyncerBase):
 
     @staticmethod
     def load_config(manifest_url):
-        config_text = requests.get(manifest_url).text.encode("utf-8")
-        manifest = json.loads(config_text)
+        # JSON is decoded from the raw UTF-8 body, without a round trip
+        # through the text guessed from the response headers
+        manifest = json.loads(util.http_session.get(manifest_url).content)
 
         #####
         authors = []
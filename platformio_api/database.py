@@ -14,7 +14,7 @@
 
 import atexit
 
-from sqlalchemy import DDL, create_engine, event, literal
+from sqlalchemy import DDL, create_engine, event, inspect, literal
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
@@ -28,7 +28,10 @@ class Match(ClauseElement):
 
     def __init__(self, columns, value):
         self.columns = columns
-        self.value = literal(value)
+        if isinstance(value, ClauseElement):
+            self.value = value
+        else:
+            self.value = literal(value)
 
 
 @compiles(Match)
@@ -39,7 +42,8 @@ def _match(element, compiler, **kw):
 
 
 def sync_db():
-    from platformio_api.models import LibFTS
+    from platformio_api.models import (LibExamples, LibFTS, LibHeaders,
+                                       LibVersions)
 
     event.listen(
         LibFTS.__table__,
@@ -51,6 +55,24 @@ def sync_db():
 
     Base.metadata.create_all(bind=engine)
 
+    # create_all() skips the existing tables, so the indexes which were
+    # added to them later are created here
+    create_missing_indexes((LibExamples, "lib_id_name"),
+                           (LibHeaders, "lib_id_name"),
+                           (LibVersions, "lib_id_released"))
+
+
+def create_missing_indexes(*items):
+    inspector = inspect(engine)
+    for model, name in items:
+        table = model.__table__
+        if any(index['name'] == name
+               for index in inspector.get_indexes(table.name)):
+            continue
+        for index in table.indexes:
+            if index.name == name:
+                index.create(bind=engine)
+
 
 engine = create_engine(config['SQLALCHEMY_DATABASE_URI'],
                        poolclass=NullPool)
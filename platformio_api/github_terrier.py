@@ -66,7 +66,7 @@ class GithubTerrier(object):
             self._process_repository(result.repository)
 
     def _process_repository(self, repository):
-        logger.info("Processing repo: %s" % repository.full_name)
+        logger.info("Processing repo: %s", repository.full_name)
         if repository.stargazers_count < self.min_repo_stars:
             return
         manifest_url = self._maybe_manifest_url(repository)
@@ -20,7 +20,6 @@ from os.path import isfile, join
 from shutil import rmtree
 from urlparse import urlparse
 
-import requests
 from pkg_resources import parse_version
 from sqlalchemy import and_, func, select
 from sqlalchemy.orm import lazyload
@@ -38,8 +37,9 @@ def process_pending_libs():
     def get_free_lib_id():
         lib_id = 0
         free_id = 0
-        query = db_session.query(models.Libs.id).order_by(models.Libs.id.asc())
-        for (lib_id, ) in query.all():
+        query = db_session.query(models.Libs.id).order_by(
+            models.Libs.id.asc())
+        for (lib_id, ) in query:
             free_id += 1
             if lib_id > free_id:
                 break
@@ -252,18 +252,19 @@ def sync_arduino_libs():
         return url
 
     used_urls = set()
-    for item in db_session.query(models.PendingLibs).all():
-        used_urls.add(item.conf_url.lower())
+    query = db_session.query(models.PendingLibs.conf_url).yield_per(500)
+    for (url, ) in query:
+        used_urls.add(url.lower())
 
     query = db_session\
         .query(models.LibsAttributes.value)\
         .join(models.Attributes)\
         .filter(models.Attributes.name.in_(["homepage", "repository.url"]))
-    for (url, ) in query.all():
+    for (url, ) in query.yield_per(500):
         url = _cleanup_url(url)
         used_urls.add(url.lower())
 
-    libs_index = requests.get(
+    libs_index = util.http_session.get(
         "http://downloads.arduino.cc/libraries/library_index.json").json()
     libs = {}
     for lib in libs_index['libraries']:
@@ -286,8 +287,8 @@ def sync_arduino_libs():
         if github_url.lower() in used_urls:
             continue
 
-        logger.debug("SyncArduinoLibs: Processing {name}, {website}".format(
-            **lib))
+        logger.debug("SyncArduinoLibs: Processing %s, %s", lib['name'],
+                     lib['website'])
 
         approved = False
         try:
@@ -300,7 +301,7 @@ def sync_arduino_libs():
                             branch=default_branch))
             if conf_url.lower() in used_urls:
                 continue
-            r = requests.get(conf_url)
+            r = util.http_session.get(conf_url)
             r.raise_for_status()
             approved = True
         except Exception:
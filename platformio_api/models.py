@@ -14,8 +14,8 @@
 
 from datetime import datetime
 
-from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, String, Text,
-                        UniqueConstraint)
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Index, String,
+                        Text, UniqueConstraint)
 from sqlalchemy.dialects.mysql import BIGINT, INTEGER, SMALLINT, VARCHAR
 from sqlalchemy.orm import relationship
 
@@ -190,6 +190,7 @@ class LibDLStats(Base):
 
 class LibExamples(Base):
     __tablename__ = "lib_examples"
+    __table_args__ = (Index("lib_id_name", "lib_id", "name"), )
 
     id = Column(INTEGER(unsigned=True), primary_key=True)
     lib_id = Column(
@@ -199,6 +200,7 @@ class LibExamples(Base):
 
 class LibHeaders(Base):
     __tablename__ = "lib_headers"
+    __table_args__ = (Index("lib_id_name", "lib_id", "name"), )
 
     id = Column(INTEGER(unsigned=True), primary_key=True)
     lib_id = Column(
@@ -240,7 +242,8 @@ class LibsPlatforms(Base):
 
 class LibVersions(Base):
     __tablename__ = "lib_versions"
-    __table_args__ = (UniqueConstraint("lib_id", "name"), )
+    __table_args__ = (UniqueConstraint("lib_id", "name"),
+                      Index("lib_id_released", "lib_id", "released"))
 
     id = Column(INTEGER(unsigned=True), primary_key=True)
     lib_id = Column(
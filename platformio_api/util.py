@@ -12,43 +12,133 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
 import logging
 import socket
 import tarfile
 import zipfile
 from contextlib import contextmanager
+from functools import wraps
 from glob import glob
 from math import ceil
-from os.path import join
-from struct import pack, unpack
+from os.path import getmtime, join
+from struct import Struct
 from subprocess import check_call
+from time import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 from platformio_api import __version__, config
 from platformio_api.exception import DLFileError, DLFileSizeError
 
+try:
+    from ujson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 logger = logging.getLogger(__name__)
 
+ip_struct = Struct("!I")
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+
+    def __init__(self, timeout, *args, **kwargs):
+        self.timeout = timeout
+        HTTPAdapter.__init__(self, *args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs['timeout'] = self.timeout
+        return HTTPAdapter.send(self, request, **kwargs)
+
+
+# shared by the crawlers, so that connections to the same hosts are reused
+http_session = requests.Session()
+http_session.headers['User-Agent'] = "PlatformIOLibRegistry/%s %s" % (
+    __version__, requests.utils.default_user_agent())
+http_session.mount(
+    "http://",
+    TimeoutHTTPAdapter(
+        timeout=(3.05, 10),  # (connect, read) in seconds
+        pool_connections=64,
+        pool_maxsize=64,
+        max_retries=Retry(
+            total=5,
+            connect=2,
+            read=False,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            raise_on_status=False)))
+http_session.mount("https://", http_session.get_adapter("http://"))
+
+
+def memoized(maxsize=128, ttl=None):
+    # keyword arguments follow the positional ones in the cache key
+    kwarg_mark = object()
+
+    def decorator(f):
+        cache = {}
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = args
+            if kwargs:
+                key += (kwarg_mark, ) + tuple(sorted(kwargs.items()))
+            now = time() if ttl else None
+            try:
+                expires, result = cache[key]
+                if not ttl or expires > now:
+                    return result
+            except KeyError:
+                pass
+            if len(cache) >= maxsize:
+                cache.clear()
+            result = f(*args, **kwargs)
+            cache[key] = (now + ttl if ttl else None, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
 
 def load_json(file_path):
     with open(file_path, "r") as f:
-        return json.load(f)
+        return json_loads(f.read())
+
+
+_static_json_cache = {}
+
+
+def load_static_json(file_path):
+    # the data files are replaced rarely, so the parsed content is reused
+    # until the modification time of the file changes
+    mtime = getmtime(file_path)
+    try:
+        cached_mtime, data = _static_json_cache[file_path]
+        if cached_mtime == mtime:
+            return data
+    except KeyError:
+        pass
+    data = load_json(file_path)
+    _static_json_cache[file_path] = (mtime, data)
+    return data
 
 
 def ip2int(ip_string):
     try:
-        return unpack("!I", socket.inet_aton(ip_string))[0]
+        return ip_struct.unpack(socket.inet_aton(ip_string))[0]
     except socket.error as e:
-        logger.error("Illegal IP address string passed to inet_aton: " +
+        logger.error("Illegal IP address string passed to inet_aton: %s",
                      ip_string)
         logger.exception(e)
     return 0
 
 
 def int2ip(ip_int):
-    return socket.inet_ntoa(pack("!I", ip_int))
+    return socket.inet_ntoa(ip_struct.pack(ip_int))
 
 
 def download_file(source_url, destination_path):
@@ -58,9 +148,7 @@ def download_file(source_url, destination_path):
     f = None
     r = None
     try:
-        headers = {"User-Agent": "PlatformIOLibRegistry/%s %s" %
-                   (__version__, requests.utils.default_user_agent())}
-        r = requests.get(source_url, headers=headers, stream=True)
+        r = http_session.get(source_url, stream=True)
         if r.status_code != 200:
             raise DLFileError("status=%d, url=%s" % (r.status_code,
                                                      source_url))
@@ -161,16 +249,22 @@ def rollback_on_exception_decorator(session, logger=None):
 
 
 def parse_namedtitled_list(ntlist, only_names=False):
-    items = []
+    # every call gets its own list, the cached pairs are immutable
+    pairs = _parse_namedtitled_pairs(ntlist)
+    if only_names:
+        return [name for name, _ in pairs]
+    return [dict(name=name, title=title) for name, title in pairs]
+
+
+# the same few framework/platform lists repeat across most libraries
+@memoized(maxsize=1024)
+def _parse_namedtitled_pairs(ntlist):
+    pairs = []
     for item in ntlist.split(","):
-        if ":" not in item:
-            continue
-        name, title = item.split(":")
-        if only_names:
-            items.append(name)
-        else:
-            items.append(dict(name=name, title=title))
-    return items
+        name, sep, title = item.partition(":")
+        if sep:
+            pairs.append((name, title))
+    return tuple(pairs)
 
 
 def is_mbed_repository(url):
@@ -22,9 +22,9 @@ from subprocess import CalledProcessError, check_call
 from sys import modules
 from tempfile import mkdtemp, mkstemp
 
-import requests
 from git import Repo
 from github import Github, GithubObject
+from requests.exceptions import RequestException
 
 from platformio_api import config, util
 
@@ -231,7 +231,8 @@ class MbedVCSClient(VCSBaseClient):
     def get_last_commit(self, path=None):
         try:
             self._last_commit = self._get_last_commit_by_ref(path)
-        except:
+        except (RequestException, AssertionError, AttributeError, ValueError):
+            # the revision page is unavailable or has an unexpected layout
             self._last_commit = self._get_last_commit_by_home(path)
         assert self._last_commit
         return self._last_commit
@@ -240,8 +241,8 @@ class MbedVCSClient(VCSBaseClient):
         if self._last_commit is not None:
             return self._last_commit
         lastrev_url = self.url + "rev/"
-        logger.debug("Fetching last revision on URL: %s" % lastrev_url)
-        r = requests.get(lastrev_url)
+        logger.debug("Fetching last revision on URL: %s", lastrev_url)
+        r = util.http_session.get(lastrev_url)
         assert 200 == r.status_code, \
             "HTTP status code is not OK. Returned code: %s" % r.status_code
         html = r.text
@@ -259,8 +260,8 @@ class MbedVCSClient(VCSBaseClient):
     def _get_last_commit_by_home(self, path=None):
         if self._last_commit is not None:
             return self._last_commit
-        logger.debug("Fetching last revision on URL: %s" % self.url)
-        r = requests.get(self.url)
+        logger.debug("Fetching last revision on URL: %s", self.url)
+        r = util.http_session.get(self.url)
         assert 200 == r.status_code, \
             "HTTP status code is not OK. Returned code: %s" % r.status_code
         html = r.text
@@ -318,7 +319,7 @@ class BitbucketVCSClient(VCSBaseClient):
         if not self.tag:
             return
 
-        response = requests.get(self.TAGS_URL % dict(
+        response = util.http_session.get(self.TAGS_URL % dict(
             owner=self._owner,
             repo_slug=self._repo_slug,
         ))
@@ -336,7 +337,7 @@ class BitbucketVCSClient(VCSBaseClient):
         if self._last_commit:
             return self._last_commit
         revision = self.tag or self.branch or self.get_main_branch()
-        response = requests.get(self.COMMITS_URL % dict(
+        response = util.http_session.get(self.COMMITS_URL % dict(
             owner=self._owner,
             repo_slug=self._repo_slug,
             revision=revision,
@@ -359,7 +360,7 @@ class BitbucketVCSClient(VCSBaseClient):
         self._download_and_unpack_archive(url, destination_dir)
 
     def get_main_branch(self):
-        response = requests.get(self.MAIN_BRANCH_URL % dict(
+        response = util.http_session.get(self.MAIN_BRANCH_URL % dict(
             owner=self._owner,
             repo_slug=self._repo_slug,
         ))
@@ -12,16 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
 import logging
+from functools import partial
 from urllib import unquote
 
 from bottle import Bottle, request, response
 
-from platformio_api import api, config
+from platformio_api import api, config, util
 from platformio_api.database import db_session
 from platformio_api.exception import APIBadRequest, APINotFound
 
+try:
+    import ujson
+    json_dumps = partial(ujson.dumps, escape_forward_slashes=False)
+except ImportError:
+    from json import dumps as json_dumps
+
 app = Bottle()
 logger = logging.getLogger(__name__)
 
@@ -31,7 +37,7 @@ def db_disconnect():
     db_session.close()
 
 
-def finalize_json_response(handler, kwargs):
+def finalize_json_response(handler, kwargs, paged=False, cached=False):
     assert issubclass(handler, api.APIBase)
     response.set_header("Access-Control-Allow-Origin",
                         str(config['API_CORS_ORIGIN']))
@@ -46,7 +52,12 @@ def finalize_json_response(handler, kwargs):
     result = None
     try:
         obj = handler(**kwargs)
-        result = obj.get_result()
+        if paged:
+            result = make_json_page(obj, obj.iter_items())
+        elif cached:
+            result = get_json_result(handler, handler.get_cache_key())
+        else:
+            result = obj.get_result()
     except APIBadRequest as error:
         status = 400
     except APINotFound as error:
@@ -61,7 +72,29 @@ def finalize_json_response(handler, kwargs):
         result = dict(message=item['title'], errors=[item])
 
     response.status = status
-    return json.dumps(result)
+    if (paged or cached) and not error:
+        return result
+    return json_dumps(result)
+
+
+@util.memoized(maxsize=16, ttl=60)
+def get_json_result(handler, cache_key):
+    # the serialized body of a parameterless handler is shared by
+    # all requests until it expires or the cache key of the handler changes
+    return json_dumps(handler().get_result())
+
+
+def make_json_page(obj, items):
+    # the page items are serialized one by one into the body, the whole
+    # result dict is never built
+    return '{"items": [%s], %s' % (
+        ", ".join(json_dumps(item) for item in items),
+        json_dumps(
+            dict(
+                total=obj.total,
+                page=obj.page,
+                perpage=obj.perpage,
+                nextcursor=obj.next_cursor))[1:])
 
 
 @app.route("/", method="OPTIONS")
@@ -78,22 +111,22 @@ def cors(request):
 
 @app.route("/boards")
 def boards():
-    return finalize_json_response(api.BoardsAPI, {})
+    return finalize_json_response(api.BoardsAPI, {}, cached=True)
 
 
 @app.route("/frameworks")
 def frameworks():
-    return finalize_json_response(api.FrameworksAPI, {})
+    return finalize_json_response(api.FrameworksAPI, {}, cached=True)
 
 
 @app.route("/packages")
 def packages():
-    return finalize_json_response(api.PackagesAPI, {})
+    return finalize_json_response(api.PackagesAPI, {}, cached=True)
 
 
 @app.route("/platforms")
 def platforms():
-    return finalize_json_response(api.PlatformsAPI, {})
+    return finalize_json_response(api.PlatformsAPI, {}, cached=True)
 
 
 @app.route("/stats")
@@ -106,24 +139,26 @@ def lib_search(apiver):
     apiver = int(apiver[2:-1]) if "/v" in apiver else 1
     args = dict(
         query=unquote(request.query.query[:255]),
-        page=int(request.query.page) if request.query.page else 0,
-        # perpage=int(request.query.perpage) if request.query.perpage else 0
-        api_version=apiver
+        page=request.query.get("page", 0, type=int),
+        # perpage=request.query.get("perpage", 0, type=int)
+        api_version=apiver,
+        cursor=request.query.cursor
     )
-    return finalize_json_response(api.LibSearchAPI, args)
+    return finalize_json_response(api.LibSearchAPI, args, paged=True)
 
 
 @app.route("/lib/examples")
 def lib_examples():
     args = dict(
         query=unquote(request.query.query[:255]),
-        page=int(request.query.page) if request.query.page else 0,
-        # perpage=int(request.query.perpage) if request.query.perpage else 0
+        page=request.query.get("page", 0, type=int),
+        # perpage=request.query.get("perpage", 0, type=int)
+        cursor=request.query.cursor
     )
-    return finalize_json_response(api.LibExamplesAPI, args)
+    return finalize_json_response(api.LibExamplesAPI, args, paged=True)
 
 
-@app.route("/lib/info/<id_>")
+@app.route("/lib/info/<id_:int>")
 def lib_info(id_):
     return finalize_json_response(api.LibInfoAPI, dict(id_=id_))
 
@@ -158,4 +193,4 @@ def lib_register():
 
 @app.route("/lib/stats")
 def lib_stats():
-    return finalize_json_response(api.LibStatsAPI, {})
+    return finalize_json_response(api.LibStatsAPI, {}, cached=True)